@@ -1,14 +1,22 @@
+import asyncio
+import logging
 import os
+import re
 import sqlite3
 import hashlib
 import secrets
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 
+import aiosqlite
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
 from fastapi import FastAPI, Request, HTTPException, Depends, Header
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -18,10 +26,13 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="vLLM Gateway",
     description="A secure gateway for vLLM API access",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configuration from environment variables
@@ -30,6 +41,38 @@ VLLM_API_KEY = os.getenv("VLLM_API_KEY", "supersecretkey")  # Fallback for devel
 DATABASE_PATH = os.getenv("DATABASE_PATH", "./gateway.db")
 GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "8001"))
 
+# API key lookup cache: api_key -> (cached_at, user_info or None for unknown keys)
+_KEY_CACHE: "OrderedDict[str, tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_KEY_CACHE_LOCK = threading.Lock()
+_CACHE_TTL = 30.0  # seconds
+_CACHE_MAX_SIZE = 10000
+
+# Shared SQLite connection pool, created on startup
+db_pool: Optional[SQLiteConnectionPool] = None
+
+# Usage events (key_id, endpoint, tokens_used, reset_usage) waiting for the background writer
+_usage_q: Optional[asyncio.Queue] = None
+_usage_task: Optional[asyncio.Task] = None
+USAGE_FLUSH_INTERVAL = 0.1  # seconds to collect events before writing a batch
+USAGE_BATCH_SIZE = 500
+
+# Daily usage window (local midnight to midnight), as epoch seconds; refreshed by authorize
+_day_start: float = 0.0
+_next_midnight: float = 0.0
+
+# Last /v1/models response from vLLM: (fetched_at, status_code, body)
+_models_cache: Optional[tuple] = None
+MODELS_CACHE_TTL = 30.0  # seconds
+
+# vLLM reports usage at the end of the response (the final SSE frame when streaming);
+# responses are requested with identity encoding so the tail is always plain JSON
+USAGE_TAIL_BYTES = 4096
+TOTAL_TOKENS_RE = re.compile(rb'"total_tokens"\s*:\s*(\d+)')
+
+# Home page and dashboard stats: (computed_at, stats)
+_stats_cache: Optional[tuple] = None
+STATS_CACHE_TTL = 5.0  # seconds
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -42,26 +85,45 @@ app.add_middleware(
 # Templates for frontend
 templates = Jinja2Templates(directory="templates")
 
+# Per-connection SQLite settings
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",   # wait for the writer instead of failing with "database is locked"
+    "PRAGMA synchronous = NORMAL",  # safe with WAL, skips the fsync on every commit
+    "PRAGMA temp_store = MEMORY",   # keep temp tables and sort buffers off disk
+    "PRAGMA cache_size = -20000",   # ~20MB page cache per connection
+)
+
+# API keys are stored as SHA-256 digests; the prefix is kept so admins can tell keys apart
+API_KEY_PREFIX_LENGTH = 12
+API_KEYS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT,
+        api_key BLOB UNIQUE NOT NULL,
+        api_key_prefix TEXT,
+        rate_limit INTEGER DEFAULT 100,
+        daily_usage INTEGER DEFAULT 0,
+        last_used TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1
+    )
+'''
+
 # Database setup
 def init_database():
     """Initialize the database with required tables"""
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
+    # WAL lets dashboard reads run alongside usage writes; the mode is stored in the database file
+    cursor.execute("PRAGMA journal_mode = WAL")
+    for pragma in CONNECTION_PRAGMAS:
+        cursor.execute(pragma)
+    
     # API Keys table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS api_keys (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT,
-            api_key TEXT UNIQUE NOT NULL,
-            rate_limit INTEGER DEFAULT 100,
-            daily_usage INTEGER DEFAULT 0,
-            last_used TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1
-        )
-    ''')
+    cursor.execute(API_KEYS_TABLE.format(table="api_keys"))
+    migrate_plaintext_keys(conn)
     
     # Usage tracking table
     cursor.execute('''
@@ -75,104 +137,191 @@ def init_database():
         )
     ''')
     
+    # Covering index for the prefix lookup in validate_api_key, answered without touching the table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_api_keys_prefix
+        ON api_keys (api_key_prefix, is_active, api_key, id, rate_limit, daily_usage, last_used, name, email)
+    ''')
+    
+    # Per-key usage reporting
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usage_logs_key_ts
+        ON usage_logs (api_key_id, timestamp)
+    ''')
+    
+    # Refresh planner statistics for the key lookup; usage_logs grows per request, so leave it out
+    cursor.execute("ANALYZE api_keys")
+    
     conn.commit()
     conn.close()
 
-def get_db_connection():
-    """Get database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+def migrate_plaintext_keys(conn: sqlite3.Connection):
+    """Rebuild an api_keys table from older versions that stored keys in plaintext"""
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(api_keys)")}
+    if columns.get("api_key") == "BLOB":
+        return
+    
+    conn.create_function("hash_api_key", 1, hash_api_key, deterministic=True)
+    conn.execute("BEGIN")
+    conn.execute(API_KEYS_TABLE.format(table="api_keys_new"))
+    conn.execute('''
+        INSERT INTO api_keys_new (id, name, email, api_key, api_key_prefix, rate_limit,
+                                  daily_usage, last_used, created_at, is_active)
+        SELECT id, name, email, hash_api_key(api_key), substr(api_key, 1, ?), rate_limit,
+               daily_usage, last_used, created_at, is_active
+        FROM api_keys
+    ''', (API_KEY_PREFIX_LENGTH,))
+    conn.execute("DROP TABLE api_keys")
+    conn.execute("ALTER TABLE api_keys_new RENAME TO api_keys")
+    conn.commit()
 
-def hash_api_key(api_key: str) -> str:
+def get_day_bounds() -> tuple:
+    """Return the epochs of the last and next local midnight"""
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    return today.timestamp(), (today + timedelta(days=1)).timestamp()
+
+async def create_db_connection() -> aiosqlite.Connection:
+    """Open a new database connection for the pool"""
+    conn = await aiosqlite.connect(DATABASE_PATH)
+    for pragma in CONNECTION_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+def hash_api_key(api_key: str) -> bytes:
     """Hash API key for storage"""
-    return hashlib.sha256(api_key.encode()).hexdigest()
+    return hashlib.sha256(api_key.encode()).digest()
+
+# Every generated key is "vllm_" plus 43 URL-safe characters (32 random bytes)
+API_KEY_LENGTH = len("vllm_") + 43
 
 def generate_api_key() -> str:
     """Generate a new API key"""
     return f"vllm_{secrets.token_urlsafe(32)}"
 
-def validate_api_key(api_key: str) -> Optional[Dict[str, Any]]:
+def is_well_formed_api_key(api_key: str) -> bool:
+    """Check that a presented key has the shape generate_api_key produces"""
+    return len(api_key) == API_KEY_LENGTH and api_key.startswith("vllm_")
+
+def _cache_get(api_key: str):
+    """Return (hit, user_info) for a cached API key lookup"""
+    with _KEY_CACHE_LOCK:
+        entry = _KEY_CACHE.get(api_key)
+        if entry is None:
+            return False, None
+        cached_at, user_info = entry
+        if time.monotonic() - cached_at >= _CACHE_TTL:
+            del _KEY_CACHE[api_key]
+            return False, None
+        _KEY_CACHE.move_to_end(api_key)
+        return True, user_info
+
+def _cache_put(api_key: str, user_info: Optional[Dict[str, Any]]):
+    """Store an API key lookup result, evicting the least recently used entry"""
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE[api_key] = (time.monotonic(), user_info)
+        _KEY_CACHE.move_to_end(api_key)
+        if len(_KEY_CACHE) > _CACHE_MAX_SIZE:
+            _KEY_CACHE.popitem(last=False)
+
+def invalidate_api_key(api_key: str):
+    """Drop an API key from the lookup cache"""
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE.pop(api_key, None)
+
+def invalidate_key_id(key_id: str):
+    """Drop every cached lookup that resolved to the given key id"""
+    with _KEY_CACHE_LOCK:
+        stale = [api_key for api_key, (_, user_info) in _KEY_CACHE.items()
+                 if user_info and user_info["id"] == key_id]
+        for api_key in stale:
+            del _KEY_CACHE[api_key]
+
+async def validate_api_key(api_key: str) -> Optional[Dict[str, Any]]:
     """Validate API key and return user info"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, email, rate_limit, daily_usage, is_active 
-        FROM api_keys 
-        WHERE api_key = ? AND is_active = 1
-    ''', (api_key,))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
+    # Malformed keys can never match, so don't let them reach the cache or the database
+    if not is_well_formed_api_key(api_key):
+        return None
+    
+    hit, user_info = _cache_get(api_key)
+    if hit:
+        return user_info
+    
+    # Look up candidates by prefix, then compare digests in constant time
+    async with db_pool.connection() as conn:
+        cursor = await conn.execute('''
+            SELECT api_key, id, name, email, rate_limit, daily_usage, CAST(strftime('%s', last_used) AS INTEGER) 
+            FROM api_keys 
+            WHERE api_key_prefix = ? AND is_active = 1
+        ''', (api_key[:API_KEY_PREFIX_LENGTH],))
+        rows = await cursor.fetchall()
+    
+    digest = hash_api_key(api_key)
+    result = None
+    for row in rows:
+        if secrets.compare_digest(row[0], digest):
+            result = row[1:]
+    
+    user_info = None
     if result:
-        return {
+        user_info = {
             "id": result[0],
             "name": result[1],
             "email": result[2],
             "rate_limit": result[3],
-            "daily_usage": result[4]
+            "daily_usage": result[4],
+            "last_used": result[5],
+            "reset_usage": False
         }
-    return None
-
-def check_rate_limit(api_key: str) -> bool:
-    """Check if API key is within rate limits"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check daily usage
-    cursor.execute('''
-        SELECT rate_limit, daily_usage 
-        FROM api_keys 
-        WHERE api_key = ?
-    ''', (api_key,))
     
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
-        return False
-    
-    rate_limit, daily_usage = result
-    
-    # Reset daily usage if it's a new day
-    cursor.execute('''
-        SELECT last_used FROM api_keys WHERE api_key = ?
-    ''', (api_key,))
-    
-    last_used = cursor.fetchone()
-    if last_used and last_used[0]:
-        last_used_date = datetime.fromisoformat(last_used[0])
-        if last_used_date.date() < datetime.now().date():
-            # Reset daily usage for new day
-            cursor.execute('''
-                UPDATE api_keys SET daily_usage = 0 WHERE api_key = ?
-            ''', (api_key,))
-            daily_usage = 0
-    
-    conn.commit()
-    conn.close()
-    
-    return daily_usage < rate_limit
+    # Unknown keys are cached too so repeated bad keys don't hit the database
+    _cache_put(api_key, user_info)
+    return user_info
 
-def log_usage(api_key: str, endpoint: str, tokens_used: int):
-    """Log API usage"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Update daily usage
-    cursor.execute('''
-        UPDATE api_keys 
-        SET daily_usage = daily_usage + ?, last_used = CURRENT_TIMESTAMP 
-        WHERE api_key = ?
-    ''', (tokens_used, api_key))
-    
-    # Log usage
-    cursor.execute('''
-        INSERT INTO usage_logs (api_key_id, endpoint, tokens_used, timestamp)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (api_key, endpoint, tokens_used))
-    
-    conn.commit()
-    conn.close()
+def log_usage(user_info: Dict[str, Any], endpoint: str, tokens_used: int):
+    """Queue API usage for the background writer"""
+    # Keep the cached copy current so rate limiting doesn't wait for the database
+    reset_usage = user_info["reset_usage"]
+    user_info["reset_usage"] = False
+    user_info["daily_usage"] += tokens_used
+    _usage_q.put_nowait((user_info["id"], endpoint, tokens_used, reset_usage))
+
+async def write_usage(events: List[tuple]):
+    """Write a batch of usage events in a single transaction"""
+    async with db_pool.connection() as conn:
+        # Update daily usage, starting from zero on the first request of a new day
+        await conn.executemany('''
+            UPDATE api_keys 
+            SET daily_usage = CASE WHEN ? THEN 0 ELSE daily_usage END + ?,
+                last_used = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', [(reset_usage, tokens_used, key_id) for key_id, _, tokens_used, reset_usage in events])
+        
+        # Log usage
+        await conn.executemany('''
+            INSERT INTO usage_logs (api_key_id, endpoint, tokens_used, timestamp)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [(key_id, endpoint, tokens_used) for key_id, endpoint, tokens_used, _ in events])
+        
+        await conn.commit()
+
+async def usage_flusher():
+    """Drain the usage queue in batches until a None sentinel is received"""
+    running = True
+    while running:
+        events = [await _usage_q.get()]
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        while not _usage_q.empty() and len(events) < USAGE_BATCH_SIZE:
+            events.append(_usage_q.get_nowait())
+        
+        if None in events:
+            running = False
+            events = [event for event in events if event is not None]
+        
+        if events:
+            try:
+                await write_usage(events)
+            except Exception as e:
+                logger.error(f"Failed to write {len(events)} usage events: {e}")
 
 def get_client_key(request: Request) -> Optional[str]:
     """Extract client API key from request headers"""
@@ -185,24 +334,33 @@ def get_client_key(request: Request) -> Optional[str]:
     
     return client_key
 
-def validate_and_check_rate_limit(request: Request) -> Dict[str, Any]:
-    """Validate API key and check rate limits"""
-    client_key = get_client_key(request)
-    
-    if not client_key:
+async def authorize(api_key: Optional[str]) -> Dict[str, Any]:
+    """Validate API key and check rate limits with a single lookup"""
+    if not api_key:
         raise HTTPException(
             status_code=401,
             detail="Missing API key. Use x-api-key header or Authorization: Bearer"
         )
     
-    user_info = validate_api_key(client_key)
+    user_info = await validate_api_key(api_key)
     if not user_info:
         raise HTTPException(
             status_code=401,
             detail="Invalid API key"
         )
     
-    if not check_rate_limit(client_key):
+    # Reset daily usage if it's a new day; the usage writer persists the reset
+    global _day_start, _next_midnight
+    now = time.time()
+    if now >= _next_midnight:
+        _day_start, _next_midnight = get_day_bounds()
+    if user_info["last_used"] is not None and user_info["last_used"] < _day_start:
+        user_info["daily_usage"] = 0
+        user_info["last_used"] = now
+        user_info["reset_usage"] = True
+    
+    # Keep the cached entry: it holds usage the writer may not have saved yet
+    if user_info["daily_usage"] >= user_info["rate_limit"]:
         raise HTTPException(
             status_code=429,
             detail="Rate limit exceeded. Try again tomorrow."
@@ -211,41 +369,51 @@ def validate_and_check_rate_limit(request: Request) -> Dict[str, Any]:
     return user_info
 
 # Frontend routes
+async def get_stats() -> Dict[str, int]:
+    """Get API key statistics for the home page and dashboard"""
+    global _stats_cache
+    if _stats_cache and time.monotonic() - _stats_cache[0] < STATS_CACHE_TTL:
+        return _stats_cache[1]
+    
+    async with db_pool.connection() as conn:
+        cursor = await conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(is_active), 0), COALESCE(SUM(daily_usage), 0)
+            FROM api_keys
+        ''')
+        total_keys, active_keys, today_requests = await cursor.fetchone()
+    
+    stats = {
+        "totalKeys": total_keys,
+        "activeKeys": active_keys,
+        "todayRequests": today_requests,
+        "totalTokens": today_requests  # For now, using same as requests
+    }
+    _stats_cache = (time.monotonic(), stats)
+    return stats
+
+def invalidate_stats():
+    """Drop cached stats so key changes show up immediately"""
+    global _stats_cache
+    _stats_cache = None
+
+def get_default_stats() -> Dict[str, int]:
+    """Stats shown when the database can't be read"""
+    return {
+        "totalKeys": 0,
+        "activeKeys": 0,
+        "todayRequests": 0,
+        "totalTokens": 0
+    }
+
 @app.get("/", response_class=HTMLResponse)
 async def home_page(request: Request):
     """Home page with landing content"""
     # Get basic stats for the home page
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) as total, SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active FROM api_keys')
-        result = cursor.fetchone()
-        
-        total_keys = result[0] if result else 0
-        active_keys = result[1] if result else 0
-        
-        # Get today's usage
-        cursor.execute('SELECT SUM(daily_usage) as today_usage FROM api_keys')
-        today_result = cursor.fetchone()
-        today_requests = today_result[0] if today_result and today_result[0] else 0
-        
-        conn.close()
-        
-        stats = {
-            "totalKeys": total_keys,
-            "activeKeys": active_keys,
-            "todayRequests": today_requests,
-            "totalTokens": today_requests  # For now, using same as requests
-        }
+        stats = await get_stats()
     except Exception as e:
         # If database error, provide default stats
-        stats = {
-            "totalKeys": 0,
-            "activeKeys": 0,
-            "todayRequests": 0,
-            "totalTokens": 0
-        }
+        stats = get_default_stats()
     
     return templates.TemplateResponse("home.html", {"request": request, "stats": stats})
 
@@ -254,36 +422,10 @@ async def dashboard(request: Request):
     """Main dashboard for API key management"""
     # Get stats for the dashboard
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) as total, SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active FROM api_keys')
-        result = cursor.fetchone()
-        
-        total_keys = result[0] if result else 0
-        active_keys = result[1] if result else 0
-        
-        # Get today's usage
-        cursor.execute('SELECT SUM(daily_usage) as today_usage FROM api_keys')
-        today_result = cursor.fetchone()
-        today_requests = today_result[0] if today_result and today_result[0] else 0
-        
-        conn.close()
-        
-        stats = {
-            "totalKeys": total_keys,
-            "activeKeys": active_keys,
-            "todayRequests": today_requests,
-            "totalTokens": today_requests  # For now, using same as requests
-        }
+        stats = await get_stats()
     except Exception as e:
         # If database error, provide default stats
-        stats = {
-            "totalKeys": 0,
-            "activeKeys": 0,
-            "todayRequests": 0,
-            "totalTokens": 0
-        }
+        stats = get_default_stats()
     
     return templates.TemplateResponse("dashboard.html", {"request": request, "stats": stats})
 
@@ -292,30 +434,27 @@ async def api_keys_page(request: Request):
     """API keys management page"""
     # Get API keys for the template
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, name, email, api_key, rate_limit, daily_usage, last_used, created_at, is_active
-            FROM api_keys
-            ORDER BY created_at DESC
-        ''')
+        async with db_pool.connection() as conn:
+            cursor = await conn.execute('''
+                SELECT id, name, email, api_key_prefix, rate_limit, daily_usage, last_used, created_at, is_active
+                FROM api_keys
+                ORDER BY created_at DESC
+            ''')
+            rows = await cursor.fetchall()
         
         keys = []
-        for row in cursor.fetchall():
+        for row in rows:
             keys.append({
                 "id": row[0],
                 "name": row[1],
                 "email": row[2],
-                "api_key": row[3],
+                "api_key_prefix": row[3],
                 "rate_limit": row[4],
                 "daily_usage": row[5],
                 "last_used": row[6],
                 "created_at": row[7],
                 "is_active": bool(row[8])
             })
-        
-        conn.close()
     except Exception as e:
         keys = []
     
@@ -336,22 +475,21 @@ async def docs_redirect():
 @app.get("/api/v1/keys")
 async def list_api_keys():
     """List all API keys (admin endpoint)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, email, api_key, rate_limit, daily_usage, last_used, created_at, is_active
-        FROM api_keys
-        ORDER BY created_at DESC
-    ''')
+    async with db_pool.connection() as conn:
+        cursor = await conn.execute('''
+            SELECT id, name, email, api_key_prefix, rate_limit, daily_usage, last_used, created_at, is_active
+            FROM api_keys
+            ORDER BY created_at DESC
+        ''')
+        rows = await cursor.fetchall()
     
     keys = []
-    for row in cursor.fetchall():
+    for row in rows:
         keys.append({
             "id": row[0],
             "name": row[1],
             "email": row[2],
-            "api_key": row[3],
+            "api_key_prefix": row[3],
             "rate_limit": row[4],
             "daily_usage": row[5],
             "last_used": row[6],
@@ -359,13 +497,12 @@ async def list_api_keys():
             "is_active": bool(row[8])
         })
     
-    conn.close()
     return {"keys": keys}
 
 @app.post("/api/v1/keys")
 async def create_api_key(request: Request):
     """Create a new API key"""
-    data = await request.json()
+    data = orjson.loads(await request.body())
     name = data.get("name", "Unnamed Key")
     email = data.get("email", "")
     rate_limit = data.get("rate_limit", 100)
@@ -373,16 +510,15 @@ async def create_api_key(request: Request):
     api_key = generate_api_key()
     key_id = str(uuid.uuid4())
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    async with db_pool.connection() as conn:
+        await conn.execute('''
+            INSERT INTO api_keys (id, name, email, api_key, api_key_prefix, rate_limit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key_id, name, email, hash_api_key(api_key), api_key[:API_KEY_PREFIX_LENGTH], rate_limit))
+        await conn.commit()
     
-    cursor.execute('''
-        INSERT INTO api_keys (id, name, email, api_key, rate_limit)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (key_id, name, email, api_key, rate_limit))
-    
-    conn.commit()
-    conn.close()
+    invalidate_api_key(api_key)
+    invalidate_stats()
     
     return {
         "id": key_id,
@@ -396,17 +532,16 @@ async def create_api_key(request: Request):
 @app.delete("/api/v1/keys/{key_id}")
 async def delete_api_key(key_id: str):
     """Delete an API key"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM api_keys WHERE id = ?', (key_id,))
-    
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="API key not found")
+    async with db_pool.connection() as conn:
+        cursor = await conn.execute('DELETE FROM api_keys WHERE id = ?', (key_id,))
+        
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="API key not found")
+        
+        await conn.commit()
     
-    conn.commit()
-    conn.close()
+    invalidate_key_id(key_id)
+    invalidate_stats()
     
     return {"message": "API key deleted successfully"}
 
@@ -414,104 +549,111 @@ async def delete_api_key(key_id: str):
 @app.get("/v1/models")
 async def get_models(request: Request):
     """Get available models from vLLM"""
-    user_info = validate_and_check_rate_limit(request)
+    global _models_cache
+    user_info = await authorize(get_client_key(request))
+    
+    # The model list rarely changes, so serve the raw vLLM response while it's fresh
+    if _models_cache and time.monotonic() - _models_cache[0] < MODELS_CACHE_TTL:
+        _, status_code, content = _models_cache
+        log_usage(user_info, "/v1/models", 0)
+        return Response(content=content, status_code=status_code, media_type="application/json")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{VLLM_URL}/models",
-                headers={"Authorization": f"Bearer {VLLM_API_KEY}"},
-                timeout=30.0
-            )
-            
-            # Log usage
-            log_usage(user_info["id"], "/v1/models", 0)
-            
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json()
-            )
+        client = request.app.state.http
+        
+        response = await client.get(
+            f"{VLLM_URL}/models",
+            headers={"Authorization": f"Bearer {VLLM_API_KEY}"},
+            timeout=30.0
+        )
+        
+        if response.status_code == 200:
+            _models_cache = (time.monotonic(), response.status_code, response.content)
+        
+        # Log usage
+        log_usage(user_info, "/v1/models", 0)
+        
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type="application/json"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error connecting to vLLM: {str(e)}")
 
-@app.post("/v1/chat/completions")
-async def chat_completions(request: Request):
-    """Handle chat completions"""
-    user_info = validate_and_check_rate_limit(request)
+async def stream_from_vllm(request: Request, user_info: Dict[str, Any], path: str) -> StreamingResponse:
+    """Forward a completion request to vLLM and stream the response back"""
     body = await request.body()
+    client = request.app.state.http
     
     try:
-        request_data = json.loads(body)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{VLLM_URL}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {VLLM_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                content=body,
-                timeout=60.0
-            )
-            
-            response_data = response.json()
-            
-            # Log usage (estimate tokens)
-            tokens_used = len(str(request_data)) // 4 + len(str(response_data)) // 4
-            log_usage(user_info["id"], "/v1/chat/completions", tokens_used)
-            
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response_data
-            )
-                
+        upstream_request = client.build_request(
+            "POST",
+            f"{VLLM_URL}{path}",
+            headers={
+                "Authorization": f"Bearer {VLLM_API_KEY}",
+                "Content-Type": "application/json",
+                # The raw body is relayed as-is, so don't let httpx ask for gzip on the client's behalf
+                "Accept-Encoding": "identity"
+            },
+            content=body,
+            timeout=60.0
+        )
+        response = await client.send(upstream_request, stream=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error connecting to vLLM: {str(e)}")
+    
+    async def relay():
+        response_size = 0
+        tail = b""
+        try:
+            async for chunk in response.aiter_raw():
+                response_size += len(chunk)
+                tail = (tail + chunk[-USAGE_TAIL_BYTES:])[-USAGE_TAIL_BYTES:]
+                yield chunk
+        finally:
+            await response.aclose()
+            
+            # Log usage, estimating from the payload sizes only when vLLM didn't include it
+            matches = TOTAL_TOKENS_RE.findall(tail)
+            if matches:
+                tokens_used = int(matches[-1])
+            else:
+                tokens_used = (len(body) >> 2) + (response_size >> 2)
+            log_usage(user_info, f"/v1{path}", tokens_used)
+    
+    # Pass these through as-is; media_type would get a second charset appended for text/* types
+    headers = {}
+    for name in ("content-type", "content-encoding"):
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    
+    return StreamingResponse(
+        relay(),
+        status_code=response.status_code,
+        headers=headers
+    )
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Handle chat completions"""
+    user_info = await authorize(get_client_key(request))
+    return await stream_from_vllm(request, user_info, "/chat/completions")
 
 @app.post("/v1/completions")
 async def completions(request: Request):
     """Handle text completions"""
-    user_info = validate_and_check_rate_limit(request)
-    body = await request.body()
-    
-    try:
-        request_data = json.loads(body)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{VLLM_URL}/completions",
-                headers={
-                    "Authorization": f"Bearer {VLLM_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                content=body,
-                timeout=60.0
-            )
-            
-            response_data = response.json()
-            
-            # Log usage
-            tokens_used = len(str(request_data)) // 4 + len(str(response_data)) // 4
-            log_usage(user_info["id"], "/v1/completions", tokens_used)
-            
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response_data
-            )
-                
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error connecting to vLLM: {str(e)}")
+    user_info = await authorize(get_client_key(request))
+    return await stream_from_vllm(request, user_info, "/completions")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint for load balancer"""
     try:
         # Check database connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        conn.close()
+        async with db_pool.connection() as conn:
+            cursor = await conn.execute("SELECT 1")
+            await cursor.fetchone()
         
         return {"status": "healthy", "timestamp": datetime.now().isoformat()}
     except Exception as e:
@@ -525,8 +667,29 @@ async def monitor_page(request: Request):
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    init_database()
+    global db_pool, _usage_q, _usage_task
+    # Schema setup uses blocking sqlite3, so keep it off the event loop
+    await asyncio.to_thread(init_database)
+    db_pool = SQLiteConnectionPool(create_db_connection)
+    # One client for all vLLM calls so connections to the backend are kept alive
+    app.state.http = httpx.AsyncClient(
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+    )
+    _usage_q = asyncio.Queue()
+    _usage_task = asyncio.create_task(usage_flusher())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Let the writer flush whatever is still queued before closing the pool
+    if _usage_task is not None:
+        _usage_q.put_nowait(None)
+        await _usage_task
+    if db_pool is not None:
+        await db_pool.close()
+    if getattr(app.state, "http", None) is not None:
+        await app.state.http.aclose()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=GATEWAY_PORT)
+    uvicorn.run(app, host="0.0.0.0", port=GATEWAY_PORT, loop="uvloop", http="httptools")
@@ -5,23 +5,26 @@ Distributes requests across multiple gateway instances
 """
 
 import asyncio
+import heapq
 import json
 import logging
 import random
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from urllib.parse import urlparse
 
 import httpx
+import orjson
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="vLLM Load Balancer", version="1.0.0")
+app = FastAPI(title="vLLM Load Balancer", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,6 +35,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request headers passed on to the gateways; hop-by-hop headers, host and content-length are dropped
+FORWARDED_HEADERS = (
+    b"authorization",
+    b"x-api-key",
+    b"content-type",
+    b"accept",
+    b"accept-encoding",
+    b"user-agent",
+)
+
 class LoadBalancer:
     def __init__(self):
         self.gateways = [
@@ -43,35 +56,99 @@ class LoadBalancer:
         self.request_counts = {gateway: 0 for gateway in self.gateways}
         self.last_health_check = {gateway: 0 for gateway in self.gateways}
         self.health_check_interval = 30  # seconds
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._rr_idx = 0
+        self._healthy_snapshot: List[str] = []
+        self._lc_heap: List[tuple] = []
+        self.stats_cache_ttl = 1.0  # seconds
+        self._stats_cache: Dict[str, tuple] = {}
+        self._refresh_snapshot()
+    
+    def _refresh_snapshot(self):
+        """Rebuild the routing state after the set of healthy gateways changes"""
+        self._healthy_snapshot = [gateway for gateway in self.gateways if self.health_status[gateway]]
+        self._rr_idx = 0
+        self._lc_heap = [(self.request_counts[gateway], gateway) for gateway in self._healthy_snapshot]
+        heapq.heapify(self._lc_heap)
+        self._stats_cache.clear()
+    
+    def cached_report(self, name: str, build) -> Response:
+        """Return a status report, rebuilding and encoding it at most once per stats_cache_ttl"""
+        current_time = time.monotonic()
+        cached = self._stats_cache.get(name)
+        if cached and current_time - cached[0] < self.stats_cache_ttl:
+            content = cached[1]
+        else:
+            # Cache the encoded body so cache hits skip FastAPI's encoding of the dict
+            content = orjson.dumps(build())
+            self._stats_cache[name] = (current_time, content)
+        
+        return Response(content=content, media_type="application/json")
+    
+    async def start(self):
+        """Create the shared HTTP client and start background health checks"""
+        self._client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+        )
+        await self.update_health_status()
+        self._health_task = asyncio.create_task(self.run_health_checks())
+    
+    async def close(self):
+        """Stop health checks and close the shared HTTP client"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     async def health_check(self, gateway: str) -> bool:
         """Check if a gateway is healthy"""
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{gateway}/health")
-                return response.status_code == 200
+            response = await self._client.get(f"{gateway}/health", timeout=5.0)
+            return response.status_code == 200
         except Exception as e:
             logger.warning(f"Health check failed for {gateway}: {e}")
             return False
     
     async def update_health_status(self):
         """Update health status of all gateways"""
+        # Check every gateway concurrently so one slow gateway doesn't delay the rest
+        results = await asyncio.gather(*[self.health_check(gateway) for gateway in self.gateways])
         current_time = time.time()
+        changed = False
         
-        for gateway in self.gateways:
-            # Only check if enough time has passed
-            if current_time - self.last_health_check[gateway] > self.health_check_interval:
-                self.health_status[gateway] = await self.health_check(gateway)
-                self.last_health_check[gateway] = current_time
-                
-                if not self.health_status[gateway]:
-                    logger.warning(f"Gateway {gateway} is unhealthy")
-                else:
-                    logger.info(f"Gateway {gateway} is healthy")
+        for gateway, healthy in zip(self.gateways, results):
+            changed = changed or healthy != self.health_status[gateway]
+            self.health_status[gateway] = healthy
+            self.last_health_check[gateway] = current_time
+            
+            if not self.health_status[gateway]:
+                logger.warning(f"Gateway {gateway} is unhealthy")
+            else:
+                logger.info(f"Gateway {gateway} is healthy")
+        
+        if changed:
+            self._refresh_snapshot()
+    
+    async def run_health_checks(self):
+        """Re-check gateway health every health_check_interval seconds"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.update_health_status()
+            except Exception as e:
+                logger.error(f"Health check loop error: {e}")
     
     def get_healthy_gateways(self) -> List[str]:
         """Get list of healthy gateways"""
-        return [gateway for gateway in self.gateways if self.health_status[gateway]]
+        return self._healthy_snapshot
     
     def select_gateway(self, strategy: str = "round_robin") -> str:
         """Select a gateway using the specified strategy"""
@@ -80,27 +157,27 @@ class LoadBalancer:
         if not healthy_gateways:
             raise HTTPException(status_code=503, detail="No healthy gateways available")
         
-        if strategy == "round_robin":
-            # Round-robin selection
-            selected = min(healthy_gateways, key=lambda g: self.request_counts[g])
-            self.request_counts[selected] += 1
-            return selected
-        
-        elif strategy == "random":
+        if strategy == "random":
             # Random selection
             return random.choice(healthy_gateways)
         
-        elif strategy == "least_connections":
-            # Least connections selection
-            selected = min(healthy_gateways, key=lambda g: self.request_counts[g])
+        if strategy == "least_connections":
+            # Least connections selection; entries lag behind round-robin picks, so fix them up lazily
+            while True:
+                count, selected = self._lc_heap[0]
+                if count == self.request_counts[selected]:
+                    break
+                heapq.heapreplace(self._lc_heap, (self.request_counts[selected], selected))
             self.request_counts[selected] += 1
+            heapq.heapreplace(self._lc_heap, (self.request_counts[selected], selected))
             return selected
         
-        else:
-            # Default to round-robin
-            selected = min(healthy_gateways, key=lambda g: self.request_counts[g])
-            self.request_counts[selected] += 1
-            return selected
+        # Round-robin selection (default)
+        idx = self._rr_idx
+        self._rr_idx = (idx + 1) % len(healthy_gateways)
+        selected = healthy_gateways[idx]
+        self.request_counts[selected] += 1
+        return selected
 
 # Initialize load balancer
 lb = LoadBalancer()
@@ -109,17 +186,16 @@ lb = LoadBalancer()
 async def startup_event():
     """Initialize load balancer on startup"""
     logger.info("Load balancer starting up...")
-    await lb.update_health_status()
+    await lb.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Load balancer shutting down...")
+    await lb.close()
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint for the load balancer"""
-    await lb.update_health_status()
+def build_health_report() -> Dict[str, Any]:
+    """Build the /health response"""
     healthy_count = len(lb.get_healthy_gateways())
     total_count = len(lb.gateways)
     
@@ -137,11 +213,8 @@ async def health_check():
         ]
     }
 
-@app.get("/stats")
-async def get_stats():
-    """Get load balancer statistics"""
-    await lb.update_health_status()
-    
+def build_stats_report() -> Dict[str, Any]:
+    """Build the /stats response"""
     return {
         "total_requests": sum(lb.request_counts.values()),
         "gateway_stats": [
@@ -155,46 +228,50 @@ async def get_stats():
         ]
     }
 
+@app.get("/health")
+async def health_check():
+    """Health check endpoint for the load balancer"""
+    return lb.cached_report("health", build_health_report)
+
+@app.get("/stats")
+async def get_stats():
+    """Get load balancer statistics"""
+    return lb.cached_report("stats", build_stats_report)
+
 async def proxy_request(request: Request, gateway: str, path: str):
     """Proxy request to a specific gateway"""
     # Reconstruct the full URL
     full_url = f"{gateway}{path}"
     
-    # Get request body
-    body = await request.body()
+    # Prepare headers (ASGI header names are already lowercase)
+    headers = [(name, value) for name, value in request.headers.raw if name in FORWARDED_HEADERS]
     
-    # Prepare headers
-    headers = dict(request.headers)
-    # Remove host header to avoid conflicts
-    headers.pop("host", None)
-    
-    # Make request to gateway
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.request(
-                method=request.method,
-                url=full_url,
-                headers=headers,
-                content=body,
-                params=request.query_params
-            )
-            
-            # Return response
-            return StreamingResponse(
-                content=response.aiter_bytes(),
-                status_code=response.status_code,
-                headers=dict(response.headers)
-            )
-            
-        except Exception as e:
-            logger.error(f"Error proxying to {gateway}: {e}")
-            raise HTTPException(status_code=502, detail=f"Gateway error: {str(e)}")
+    # Make request to gateway, forwarding the body as it arrives
+    try:
+        gateway_request = lb._client.build_request(
+            method=request.method,
+            url=full_url,
+            headers=headers,
+            content=request.stream(),
+            params=request.query_params
+        )
+        response = await lb._client.send(gateway_request, stream=True)
+        
+        # Return response, releasing the gateway connection once it has been sent
+        return StreamingResponse(
+            content=response.aiter_raw(),
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            background=BackgroundTask(response.aclose)
+        )
+        
+    except Exception as e:
+        logger.error(f"Error proxying to {gateway}: {e}")
+        raise HTTPException(status_code=502, detail=f"Gateway error: {str(e)}")
 
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_all(request: Request, path: str):
     """Proxy all requests to healthy gateways"""
-    await lb.update_health_status()
-    
     try:
         # Select a healthy gateway
         selected_gateway = lb.select_gateway(strategy="round_robin")
@@ -210,4 +287,4 @@ async def proxy_all(request: Request, path: str):
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting vLLM Load Balancer on port 8080")
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(app, host="0.0.0.0", port=8080, loop="uvloop", http="httptools")